@@ -1,18 +1,20 @@
 import logging
 import os
 import time
-import json
-import re
+import functools
+import itertools
+import ssl
 import sys
 import urllib3
 import platform
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
 from datetime import datetime
 
+import orjson
 import requests
-import websocket
-
-# Suppress insecure request warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Set up enhanced logging
 logging.basicConfig(
@@ -41,6 +43,13 @@ PASSWORD = os.getenv("PASSWORD")
 USE_SSL = os.getenv("USE_SSL", "false").lower() == "true"
 VERIFY_SSL = os.getenv("VERIFY_SSL", "false").lower() == "true"
 NOTIFY_ON_SUCCESS = os.getenv("NOTIFY_ON_SUCCESS", "false").lower() == "true"
+FORCE_WEBSOCKET = os.getenv("FORCE_WEBSOCKET", "false").lower() == "true"
+APPRISE_URLS = os.getenv("APPRISE_URLS", "")
+try:
+    API_CACHE_TTL = int(os.getenv("API_CACHE_TTL") or "3600")
+except ValueError:
+    logger.warning(f"Invalid API_CACHE_TTL {os.getenv('API_CACHE_TTL')!r}; using 3600")
+    API_CACHE_TTL = 3600
 TZ = os.getenv("TZ", "UTC")
 
 logger.info(f"Configuration:")
@@ -50,6 +59,9 @@ logger.info(f"  USERNAME: {'Configured' if USERNAME else 'Not configured'}")
 logger.info(f"  USE_SSL: {USE_SSL}")
 logger.info(f"  VERIFY_SSL: {VERIFY_SSL}")
 logger.info(f"  NOTIFY_ON_SUCCESS: {NOTIFY_ON_SUCCESS}")
+logger.info(f"  APPRISE_URLS: {'Configured' if APPRISE_URLS else 'Not configured'}")
+logger.info(f"  FORCE_WEBSOCKET: {FORCE_WEBSOCKET}")
+logger.info(f"  API_CACHE_TTL: {API_CACHE_TTL}")
 logger.info(f"  TZ: {TZ}")
 
 if not BASE_URL:
@@ -60,76 +72,379 @@ if not (API_KEY or (USERNAME and PASSWORD)):
     logger.error("Either API_KEY or both USERNAME and PASSWORD must be provided")
     sys.exit(1)
 
+# Suppress insecure request warnings
+if not VERIFY_SSL:
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Server URLs, built once from the configuration
+HTTP_BASE = f"{'https' if USE_SSL else 'http'}://{BASE_URL}"
+WS_URL = f"{'wss' if USE_SSL else 'ws'}://{BASE_URL}/websocket"
+
+# Apprise loads all of its notification plugins on import, so it is only
+# imported and set up the first time a notification is actually sent
+apprise_client = None
+
+def get_apprise_client():
+    global apprise_client
+    if apprise_client is None:
+        import apprise
+        
+        apprise_client = apprise.Apprise()
+        for url in filter(None, (u.strip() for u in APPRISE_URLS.split(","))):
+            apprise_client.add(url)
+    return apprise_client
+
+def send_notification(title, body):
+    if not APPRISE_URLS:
+        return
+    
+    try:
+        if not get_apprise_client().notify(title=title, body=body):
+            logger.error("Failed to send notification")
+    except Exception as e:
+        logger.error(f"Failed to send notification: {str(e)}")
+
+# Upper bound on upgrade jobs waited on at the same time
+MAX_PARALLEL_JOBS = 8
+
+# Built once and shared by every connection when certificates are not verified
+ssl_context = None
+if not VERIFY_SSL:
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+
+class SSLContextAdapter(HTTPAdapter):
+    """HTTPAdapter that hands a prebuilt SSL context to its connection pools"""
+    def __init__(self, ssl_context=None, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        if self.ssl_context:
+            kwargs["ssl_context"] = self.ssl_context
+        super().init_poolmanager(*args, **kwargs)
+    
+    def send(self, request, **kwargs):
+        # requests lets REQUESTS_CA_BUNDLE/CURL_CA_BUNDLE override session.verify
+        if self.ssl_context:
+            kwargs["verify"] = False
+        return super().send(request, **kwargs)
+
+# Build a session that keeps connections alive between calls
+def create_session(base_url, headers=None):
+    session = requests.Session()
+    session.headers.update(headers or {})
+    session.verify = VERIFY_SSL
+    session.mount(base_url, SSLContextAdapter(
+        ssl_context=ssl_context,
+        pool_connections=1,
+        pool_maxsize=MAX_PARALLEL_JOBS,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,
+        ),
+    ))
+    return session
+
+probe_session = create_session(HTTP_BASE, {"Accept-Encoding": "identity"})
+
+# Cache of the API detection result, shared between scheduled runs
+API_CACHE_PATH = "/tmp/truenas_api_cache.json"
+
+def load_cached_api_type():
+    if API_CACHE_TTL <= 0:
+        return None
+    
+    try:
+        with open(API_CACHE_PATH, "rb") as f:
+            cache = orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    
+    if time.time() >= cache.get("expires_at", 0):
+        return None
+    if cache.get("base_url") != BASE_URL or cache.get("use_ssl") != USE_SSL:
+        return None
+    return cache.get("new_api")
+
+def save_cached_api_type(new_api):
+    if API_CACHE_TTL <= 0:
+        return
+    
+    cache = {
+        "base_url": BASE_URL,
+        "use_ssl": USE_SSL,
+        "new_api": new_api,
+        "expires_at": time.time() + API_CACHE_TTL,
+    }
+    tmp_path = f"{API_CACHE_PATH}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(cache))
+        os.replace(tmp_path, API_CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"Failed to write API cache: {str(e)}")
+
 # Determine if we should use WebSocket API or REST API
+@functools.lru_cache(maxsize=1)
 def is_new_api():
-    url = f"{'https' if USE_SSL else 'http'}://{BASE_URL}/api/versions"
+    cached = load_cached_api_type()
+    if cached is not None:
+        logger.info("Using cached API detection result")
+        return cached
+    
     try:
-        response = requests.get(url, verify=VERIFY_SSL)
-        return response.status_code == 200
+        response = probe_session.get(f"{HTTP_BASE}/api/versions")
     except:
         return False
+    
+    new_api = response.status_code == 200
+    # Only remember definite answers, not transient server errors
+    if response.status_code in (200, 404):
+        save_cached_api_type(new_api)
+    return new_api
+
+def detect_api():
+    """Return True when the WebSocket API should be used"""
+    if FORCE_WEBSOCKET:
+        logger.info("FORCE_WEBSOCKET is set; skipping API detection")
+        return True
+    # The REST client only authenticates with an API key
+    if not API_KEY:
+        logger.info("No API_KEY configured; using the WebSocket API for username/password login")
+        return True
+    return is_new_api()
+
+# Update indicators used across different TrueNAS versions
+UPDATE_KEYS = (
+    "update_available",
+    "container_images_update_available",
+    "update_available_train",
+    "outdated",
+    "needs_update",
+)
+
+# Identifier fields used across different TrueNAS versions, in order of preference
+ID_KEYS = ("name", "release_name", "id", "app_name")
+
+def needs_update(release):
+    return any(release.get(key) for key in UPDATE_KEYS)
+
+def get_release_identifier(release):
+    for key in ID_KEYS:
+        if release.get(key):
+            return release[key]
+    # Some chart releases only carry their name in the config
+    return (release.get("config") or {}).get("release_name")
 
-# WebSocket authentication
-def websocket_auth(ws):
+# WebSocket authentication message
+def websocket_auth():
     if USERNAME and PASSWORD:
-        ws.send(json.dumps({"id": "auth", "msg": "method", "method": "auth.login", "params": [USERNAME, PASSWORD]}))
+        return {"id": "auth", "msg": "method", "method": "auth.login", "params": [USERNAME, PASSWORD]}
     elif API_KEY:
-        ws.send(json.dumps({"id": "auth", "msg": "method", "method": "auth.login_with_api_key", "params": [API_KEY]}))
+        return {"id": "auth", "msg": "method", "method": "auth.login_with_api_key", "params": [API_KEY]}
     else:
         raise Exception("No authentication credentials provided.")
-    
-    result = json.loads(ws.recv())
-    if result.get("result") != True:
-        raise Exception("Authentication failed")
+
+# Seconds to wait for the reply to a single WebSocket call
+CALL_TIMEOUT = 60
+# Seconds between pings that keep an idle WebSocket alive during long jobs
+PING_INTERVAL = 20
+# Seconds to wait for any frame after a ping before the connection is given up
+PING_TIMEOUT = 30
+# Times a job wait reconnects after losing the WebSocket before giving up
+JOB_RECONNECTS = 3
+# Seconds between checks on a job whose final state has not arrived yet
+JOB_CHECK_INTERVAL = 300
 
 # WebSocket API class
 class TrueNASWebSocketAPI:
     def __init__(self):
         self.ws = None
-        self.call_id = 1
+        # next() on a count is atomic, so threads never share a call id
+        self.call_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.connect_lock = threading.Lock()
+        # Per-connection futures, keyed by call id and job id
+        self.pending = {}
+        self.jobs = {}
+        self.jobs_subscribed = False
         self.connect()
         
     def connect(self):
+        # Imported here so REST-only runs never load websocket-client
+        import websocket
+        
+        ws = None
         try:
-            ws_url = f"{'wss' if USE_SSL else 'ws'}://{BASE_URL}/websocket"
-            logger.info(f"Connecting to WebSocket API at {ws_url}")
+            logger.info(f"Connecting to WebSocket API at {WS_URL}")
             
-            self.ws = websocket.create_connection(
-                ws_url, 
-                sslopt={"cert_reqs": 0} if not VERIFY_SSL else {}
+            ws = websocket.create_connection(
+                WS_URL, 
+                sslopt={"context": ssl_context} if not VERIFY_SSL else {},
+                timeout=10,
+                # Calls are sent from several threads while a reader thread receives
+                enable_multithread=True,
+                # Every frame is parsed as JSON anyway, which rejects invalid UTF-8
+                skip_utf8_validation=True,
             )
             
-            # Initial connection message
-            self.ws.send(json.dumps({"msg": "connect", "version": "1"}))
-            if json.loads(self.ws.recv()).get("msg") != "connected":
+            # Send the connection message and the login back to back; the
+            # middleware handles them in order, which saves a round trip
+            ws.send(orjson.dumps({"msg": "connect", "version": "1"}))
+            ws.send(orjson.dumps(websocket_auth()))
+            
+            if orjson.loads(ws.recv()).get("msg") != "connected":
                 raise Exception("WebSocket connection failed")
-                
-            # Authenticate
-            websocket_auth(self.ws)
+            if orjson.loads(ws.recv()).get("result") != True:
+                raise Exception("Authentication failed")
             logger.info("Successfully authenticated with WebSocket API")
             
+            # Subscribe before any job is started so no job update can be missed
+            ws.send(orjson.dumps({"msg": "sub", "id": "jobs", "name": "core.get_jobs"}))
+            
         except Exception as e:
             logger.error(f"Failed to connect to WebSocket API: {str(e)}")
-            if self.ws:
-                self.ws.close()
-                self.ws = None
+            if ws:
+                ws.close()
             raise
+        
+        # From here on all incoming messages are read by a background thread,
+        # which has to block for as long as jobs run
+        ws.settimeout(None)
+        pending = {}
+        jobs = {}
+        with self.lock:
+            self.pending = pending
+            self.jobs = jobs
+            self.jobs_subscribed = True
+        closed = threading.Event()
+        heard = threading.Event()
+        threading.Thread(
+            target=self.read_messages,
+            args=(ws, pending, jobs, closed, heard),
+            daemon=True,
+        ).start()
+        threading.Thread(target=self.send_pings, args=(ws, closed, heard), daemon=True).start()
+        
+        # Publish the connection last, so no call can go out ahead of the login
+        with self.lock:
+            if not closed.is_set():
+                self.ws = ws
+        if self.ws is not ws:
+            ws.shutdown()
+            raise ConnectionError("WebSocket connection closed during setup")
     
     def disconnect(self):
-        if self.ws:
+        ws, self.ws = self.ws, None
+        if ws:
             try:
-                self.ws.close()
+                ws.close()
             except Exception as e:
                 logger.error(f"Error closing WebSocket: {str(e)}")
-            finally:
-                self.ws = None
     
-    def call(self, method, params=None):
-        if not self.ws:
-            self.connect()
+    def close(self):
+        self.disconnect()
+    
+    def read_messages(self, ws, pending, jobs, closed, heard):
+        """Resolve the futures of call results and job updates as they arrive"""
+        from websocket import ABNF
+        
+        try:
+            while True:
+                # Control frames are returned too, so pongs reach the pinger
+                opcode, data = ws.recv_data(control_frame=True)
+                heard.set()
+                if opcode == ABNF.OPCODE_CLOSE:
+                    raise ConnectionError("closed by server")
+                if opcode not in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
+                    continue
+                
+                message = orjson.loads(data)
+                msg = message.get("msg")
+                
+                if msg == "result":
+                    with self.lock:
+                        future = pending.pop(message.get("id"), None)
+                    if future:
+                        future.set_result(message)
+                elif msg in ("added", "changed") and message.get("collection") == "core.get_jobs":
+                    self.update_job(jobs, message.get("fields") or {})
+                elif msg == "nosub" and message.get("id") == "jobs":
+                    logger.warning(f"Job subscription rejected: {message.get('error')}; using core.job_wait")
+                    with self.lock:
+                        if self.jobs is jobs:
+                            self.jobs_subscribed = False
+                        # Wake the waits so they switch to core.job_wait
+                        for future in jobs.values():
+                            if not future.done():
+                                future.set_result(None)
+                    
+        except Exception as e:
+            if self.ws is ws:
+                logger.error(f"WebSocket connection lost: {str(e)}")
+        finally:
+            # Fail everything still waiting on this connection; send_call only
+            # registers calls for the published connection, under the same lock
+            with self.lock:
+                closed.set()
+                if self.ws is ws:
+                    self.ws = None
+                for future in list(pending.values()) + list(jobs.values()):
+                    if not future.done():
+                        future.set_exception(ConnectionError("WebSocket connection closed"))
+                pending.clear()
+    
+    def send_pings(self, ws, closed, heard):
+        """Ping while the connection is idle and drop it once the server stops answering"""
+        while not closed.wait(PING_INTERVAL):
+            heard.clear()
+            try:
+                ws.ping()
+            except Exception as e:
+                logger.error(f"WebSocket ping failed: {str(e)}")
+                ws.abort()
+                return
             
-        call_id = str(self.call_id)
-        self.call_id += 1
+            if not heard.wait(PING_TIMEOUT) and not closed.is_set():
+                # Shutting the socket down wakes the reader, which fails everything still waiting
+                logger.error(f"No reply to WebSocket ping within {PING_TIMEOUT}s")
+                ws.abort()
+                return
+    
+    def track_job(self, job_id):
+        with self.lock:
+            return self.jobs.setdefault(job_id, Future())
+    
+    def update_job(self, jobs, job):
+        if job.get("state") not in ("SUCCESS", "FAILED", "ABORTED"):
+            return
+        with self.lock:
+            future = jobs.setdefault(job.get("id"), Future())
+            if not future.done():
+                future.set_result(job)
+    
+    def send_call(self, method, params=None):
+        """Send a call without waiting for its result; returns (call_id, future) or None"""
+        if not self.ws:
+            with self.connect_lock:
+                if not self.ws:
+                    self.connect()
+        
+        call_id = str(next(self.call_ids))
+        future = Future()
+        # Register the call with the connection it is sent on, so losing that
+        # connection fails this call along with the rest
+        with self.lock:
+            ws, pending = self.ws, self.pending
+            if ws:
+                pending[call_id] = future
+        if not ws:
+            logger.error(f"WebSocket call {method} failed: connection lost")
+            return None
         
         request = {
             "id": call_id,
@@ -140,28 +455,53 @@ class TrueNASWebSocketAPI:
         
         try:
             logger.debug(f"Sending WebSocket call: {method}")
-            self.ws.send(json.dumps(request))
-            response = json.loads(self.ws.recv())
-            
-            if response.get("id") != call_id:
-                logger.error(f"Received response with mismatched ID: {response.get('id')} vs {call_id}")
-                return None
-                
-            if "error" in response:
-                logger.error(f"API error: {response.get('error')}")
-                return None
-                
-            return response.get("result")
-            
+            ws.send(orjson.dumps(request))
         except Exception as e:
             logger.error(f"WebSocket call failed: {str(e)}")
-            self.disconnect()
+            with self.lock:
+                pending.pop(call_id, None)
+            # Shutting the socket down makes its reader fail the other calls
+            ws.abort()
+            return None
+        
+        return call_id, future
+    
+    def call_result(self, method, call_id, future, timeout=CALL_TIMEOUT):
+        try:
+            response = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            logger.error(f"WebSocket call {method} timed out after {timeout}s")
+            with self.lock:
+                self.pending.pop(call_id, None)
+            return None
+        except ConnectionError as e:
+            logger.error(f"WebSocket call {method} failed: {str(e)}")
             return None
+            
+        if "error" in response:
+            logger.error(f"API error: {response.get('error')}")
+            return None
+            
+        return response.get("result")
+    
+    def call(self, method, params=None, timeout=CALL_TIMEOUT):
+        sent = self.send_call(method, params)
+        if not sent:
+            return None
+        return self.call_result(method, *sent, timeout=timeout)
     
     def get_chart_releases(self):
         logger.info("Fetching apps via WebSocket API...")
-        releases = self.call("app.query")
-        if releases:
+        # Let the middleware drop the apps that have no update, and return only
+        # the fields we read instead of each app's full config
+        update_filter = [["OR", [[key, "=", True] for key in UPDATE_KEYS]]]
+        options = {"select": list(ID_KEYS + UPDATE_KEYS)}
+        releases = self.call("app.query", [update_filter, options])
+        if releases is None:
+            logger.info("Filtered app query failed, fetching all apps instead")
+            releases = self.call("app.query")
+        
+        if releases is not None:
             logger.info(f"Retrieved {len(releases)} apps")
         else:
             logger.error("Failed to retrieve apps")
@@ -169,33 +509,144 @@ class TrueNASWebSocketAPI:
     
     def upgrade_chart_release(self, release_name):
         logger.info(f"Triggering upgrade for {release_name} via WebSocket API...")
-        return self.call("app.upgrade", [release_name])
+        job_id = self.call("app.upgrade", [release_name])
+        if job_id:
+            self.track_job(job_id)
+        return job_id
+    
+    def bulk_upgrade(self, release_names):
+        """Send every upgrade back to back, then collect the job ids in order"""
+        sent = []
+        for release_name in release_names:
+            logger.info(f"Triggering upgrade for {release_name} via WebSocket API...")
+            sent.append(self.send_call("app.upgrade", [release_name]))
+        job_ids = [self.call_result("app.upgrade", *s) if s else None for s in sent]
+        for job_id in filter(None, job_ids):
+            self.track_job(job_id)
+        return job_ids
     
     def wait_for_job(self, job_id):
         logger.info(f"Waiting for job {job_id} to complete...")
-        return self.call("core.job_wait", [job_id])
+        with self.lock:
+            future = self.jobs.get(job_id)
+        
+        # Jobs started on this connection are resolved by the subscription alone;
+        # any other job may already have finished, so look up its state once
+        if future is None:
+            if not self.check_job(job_id):
+                logger.error(f"Job {job_id} could not be found")
+                return None
+            future = self.track_job(job_id)
+        
+        reconnects = 0
+        while True:
+            if not self.jobs_subscribed:
+                # Without job events the middleware has to tell us when the job ends
+                return self.call("core.job_wait", [job_id], timeout=None)
+            
+            try:
+                job = future.result(timeout=JOB_CHECK_INTERVAL)
+            except FutureTimeoutError:
+                # Don't rely on the final event alone; a missed one would hang this wait
+                if not self.check_job(job_id):
+                    logger.error(f"Job {job_id} could not be found")
+                    return None
+                future = self.track_job(job_id)
+                continue
+            except ConnectionError:
+                # The job keeps running on the server, so look it up again on a new connection
+                if reconnects == JOB_RECONNECTS:
+                    logger.error(f"Lost connection while waiting for job {job_id}")
+                    return None
+                reconnects += 1
+                logger.warning(f"Lost connection while waiting for job {job_id}; reconnecting")
+                try:
+                    found = self.check_job(job_id)
+                except Exception as e:
+                    logger.error(f"Failed to reconnect while waiting for job {job_id}: {str(e)}")
+                    return None
+                if not found:
+                    logger.error(f"Job {job_id} could not be found")
+                    return None
+                future = self.track_job(job_id)
+                continue
+            
+            if job is not None:
+                break
+        
+        if job.get("state") != "SUCCESS":
+            logger.error(f"Job {job_id} finished with state {job.get('state')}: {job.get('error')}")
+            return None
+        
+        return job.get("result")
+    
+    def check_job(self, job_id):
+        """Look up a job's current state; returns False when it is unknown"""
+        jobs = self.call("core.get_jobs", [[["id", "=", job_id]]])
+        if jobs:
+            self.update_job(self.jobs, jobs[0])
+        # Without rights to read jobs, core.job_wait is the only way left
+        elif jobs is None:
+            with self.lock:
+                self.jobs_subscribed = False
+        return jobs != []
 
 # REST API class
 class TrueNASRestAPI:
     def __init__(self):
-        self.headers = {"Authorization": f"Bearer {API_KEY}"} if API_KEY else {}
-        self.base_url = f"{'https' if USE_SSL else 'http'}://{BASE_URL}/api/v2.0"
+        # Most responses are a job id or a small result, not worth decompressing
+        self.headers = {"Accept": "application/json", "Accept-Encoding": "identity"}
+        if API_KEY:
+            self.headers["Authorization"] = f"Bearer {API_KEY}"
+        self.base_url = f"{HTTP_BASE}/api/v2.0"
+        self.releases_url = f"{self.base_url}/chart/release"
+        self.upgrade_url = f"{self.base_url}/chart/release/upgrade"
+        self.job_wait_url = f"{self.base_url}/core/job_wait"
+        self.session = create_session(self.base_url, self.headers)
+    
+    def close(self):
+        self.session.close()
+    
+    def post(self, url, **kwargs):
+        """POST, backing off for as long as the server asks when it is busy"""
+        response = self.session.post(url, **kwargs)
+        for _ in range(3):
+            if response.status_code not in (429, 503):
+                break
+            
+            try:
+                delay = min(max(int(response.headers.get("Retry-After", 1)), 0), 30)
+            except ValueError:
+                delay = 1
+            logger.warning(f"Server busy (HTTP {response.status_code}), retrying in {delay}s")
+            time.sleep(delay)
+            response = self.session.post(url, **kwargs)
+        return response
         
     def get_chart_releases(self):
+        # Imported here so WebSocket-only runs never load ijson
+        import ijson
+        
         try:
             logger.info("Fetching chart releases via REST API...")
-            response = requests.get(
-                f"{self.base_url}/chart/release",
-                headers=self.headers,
-                verify=VERIFY_SSL,
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Failed to get chart releases: HTTP {response.status_code}")
-                return None
+            with self.session.get(
+                self.releases_url,
+                headers={"Accept-Encoding": "gzip"},
+                stream=True,
+            ) as response:
+                if response.status_code != 200:
+                    logger.error(f"Failed to get chart releases: HTTP {response.status_code}")
+                    return None
+                
+                # Parse the release list as it arrives and keep only the releases
+                # that need an update instead of building the whole payload
+                response.raw.decode_content = True
+                releases = [
+                    r for r in ijson.items(response.raw, "item", use_float=True)
+                    if needs_update(r)
+                ]
             
-            releases = response.json()
-            logger.info(f"Retrieved {len(releases)} chart releases")
+            logger.info(f"Retrieved {len(releases)} chart releases with updates available")
             return releases
             
         except Exception as e:
@@ -205,11 +656,9 @@ class TrueNASRestAPI:
     def upgrade_chart_release(self, release_name):
         try:
             logger.info(f"Triggering upgrade for {release_name} via REST API...")
-            upgrade_response = requests.post(
-                f"{self.base_url}/chart/release/upgrade",
-                headers=self.headers,
+            upgrade_response = self.post(
+                self.upgrade_url,
                 json={"release_name": release_name},
-                verify=VERIFY_SSL,
             )
             
             if upgrade_response.status_code != 200:
@@ -227,11 +676,9 @@ class TrueNASRestAPI:
     def wait_for_job(self, job_id):
         try:
             logger.info(f"Waiting for job {job_id} to complete...")
-            job_response = requests.post(
-                f"{self.base_url}/core/job_wait",
-                headers=self.headers,
+            job_response = self.post(
+                self.job_wait_url,
                 json=job_id,
-                verify=VERIFY_SSL,
             )
             
             if job_response.status_code != 200:
@@ -239,7 +686,7 @@ class TrueNASRestAPI:
                 return None
             
             logger.info(f"Job {job_id} completed successfully")
-            return job_response.json()
+            return orjson.loads(job_response.content)
             
         except Exception as e:
             logger.error(f"Failed to wait for job {job_id}: {str(e)}")
@@ -250,7 +697,7 @@ def update_charts():
     logger.info("Starting chart update check")
     
     # Determine which API to use
-    new_api = is_new_api()
+    new_api = detect_api()
     logger.info(f"Using {'new WebSocket' if new_api else 'old REST'} API")
     
     # Create the appropriate API client
@@ -263,86 +710,89 @@ def update_charts():
         # Step 1: Retrieve installed chart releases
         releases = api_client.get_chart_releases()
         
-        if not releases:
+        if releases is None:
             logger.error(f"Failed to get chart releases")
+            send_notification("TrueNAS Auto Update failed", "Failed to get chart releases")
             return False
         
-        # Step 2: Filter releases that need an update
-        def needs_update(release):
-            # Check for various update indicators across different TrueNAS versions
-            return (
-                release.get("update_available", False) or 
-                release.get("container_images_update_available", False) or
-                release.get("update_available_train", False) or
-                release.get("outdated", False) or
-                release.get("needs_update", False)
-            )
-        
-        releases_to_upgrade = [r for r in releases if needs_update(r)]
+        # Step 2: Filter releases that need an update, resolving each identifier once
+        releases_to_upgrade = []
+        for release in releases:
+            if not needs_update(release):
+                continue
+            
+            release_identifier = get_release_identifier(release)
+            if not release_identifier:
+                logger.warning("Found a release without a valid identifier; skipping.")
+                continue
+            
+            releases_to_upgrade.append((release_identifier, release))
         
         if not releases_to_upgrade:
             logger.info("No chart releases need updates at this time")
             return True
         
-        logger.info(f"Found {len(releases_to_upgrade)} chart release(s) that need an update:")
-        for r in releases_to_upgrade:
-            # Try to find the name using various field names across different TrueNAS versions
-            name = (
-                r.get("name") or 
-                r.get("release_name") or 
-                r.get("id") or
-                r.get("app_name") or
-                "unknown"
-            )
-            logger.info(f"  - {name}")
+        logger.info(
+            f"Found {len(releases_to_upgrade)} chart release(s) that need an update:\n"
+            + "\n".join(f"  - {release_identifier}" for release_identifier, _ in releases_to_upgrade)
+        )
         
-        update_count = 0
+        release_identifiers = [release_identifier for release_identifier, _ in releases_to_upgrade]
         
-        # Step 3: Loop over each release and trigger an upgrade
-        for release in releases_to_upgrade:
-            # Get the release identifier based on the API version
-            release_identifier = (
-                release.get("name") or
-                release.get("release_name") or
-                release.get("config", {}).get("release_name") or
-                release.get("id") or
-                release.get("app_name")
-            )
-            if not release_identifier:
-                logger.warning("Found a release without a valid identifier; skipping.")
-                continue
-            
-            logger.info(f"Upgrading release {release_identifier}...")
-            
-            job_id = api_client.upgrade_chart_release(release_identifier)
-            
-            if not job_id:
-                logger.error(f"Failed to trigger upgrade for {release_identifier}")
-                continue
-            
-            job_result = api_client.wait_for_job(job_id)
-            
-            if job_result:
-                success_msg = f"Upgrade for {release_identifier} completed successfully"
-                logger.info(success_msg)
-                update_count += 1
+        update_count = 0
+        failed_releases = []
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_JOBS, len(release_identifiers))) as executor:
+            # Step 3: Trigger all upgrades at once
+            jobs = []
+            if new_api:
+                job_ids = api_client.bulk_upgrade(release_identifiers)
             else:
-                logger.error(f"Upgrade job for {release_identifier} failed")
+                job_ids = executor.map(api_client.upgrade_chart_release, release_identifiers)
+            for release_identifier, job_id in zip(release_identifiers, job_ids):
+                if not job_id:
+                    logger.error(f"Failed to trigger upgrade for {release_identifier}")
+                    failed_releases.append(release_identifier)
+                    continue
+                
+                jobs.append((release_identifier, job_id))
             
-            time.sleep(1)
+            # Step 4: Wait for the upgrade jobs concurrently; TrueNAS runs them server-side
+            waits = {
+                executor.submit(api_client.wait_for_job, job_id): release_identifier
+                for release_identifier, job_id in jobs
+            }
+            
+            # Report each upgrade as soon as its job finishes
+            for wait in as_completed(waits):
+                release_identifier = waits[wait]
+                if wait.result():
+                    success_msg = f"Upgrade for {release_identifier} completed successfully"
+                    logger.info(success_msg)
+                    update_count += 1
+                else:
+                    logger.error(f"Upgrade job for {release_identifier} failed")
+                    failed_releases.append(release_identifier)
         
         summary_msg = f"Completed with {update_count} successful updates out of {len(releases_to_upgrade)} attempts"
         logger.info(summary_msg)
+        
+        if failed_releases:
+            send_notification(
+                "TrueNAS Auto Update failed",
+                f"{summary_msg}\nFailed: {', '.join(str(r) for r in failed_releases)}",
+            )
+        elif NOTIFY_ON_SUCCESS and update_count:
+            send_notification("TrueNAS Auto Update", summary_msg)
         return update_count > 0
         
     finally:
         # Clean up resources
-        if new_api and hasattr(api_client, 'disconnect'):
-            api_client.disconnect()
+        api_client.close()
 
 if __name__ == "__main__":
     try:
         update_charts()
     except Exception as e:
         logger.error(f"Unhandled exception: {str(e)}")
+        send_notification("TrueNAS Auto Update failed", f"Unhandled exception: {str(e)}")
         sys.exit(1)
\ No newline at end of file